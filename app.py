@@ -1,74 +1,230 @@
 import streamlit as st
 import pandas as pd
+import os
+import tempfile
 import re # For more flexible keyword matching
+import ahocorasick # Linear-time multi-keyword search over the user's query
+
+# Words of 3+ characters; used for both product names and user queries
+TOKEN_RE = re.compile(r'\b\w{3,}\b')
+
+# Common words that carry no product meaning and would only cause spurious matches
+STOPWORDS = frozenset({
+    'the', 'for', 'with', 'about', 'tell', 'have', 'you', 'your', 'can', 'use',
+    'any', 'anything', 'what', 'how', 'some', 'are', 'and', 'from',
+})
 
 # --- Data Loading ---
+# Matching-only columns added to products_df at load time; hidden from the data preview
+DERIVED_PRODUCT_COLUMNS = ['ProductName_lc', 'RelatedKeywords_lc', 'search_text']
+
+def write_parquet_atomically(df, parquet_path):
+    """Writes to a temp file and swaps it in, so an interrupted write never leaves a truncated copy."""
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(parquet_path) or '.', suffix='.tmp.parquet')
+        os.close(fd)
+        df.to_parquet(tmp_path, index=False)
+        os.chmod(tmp_path, 0o644) # mkstemp creates owner-only files
+        os.replace(tmp_path, parquet_path)
+    except OSError:
+        pass # Read-only deployments just use the parsed CSV
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def read_csv_via_parquet(csv_path):
+    """Reads a CSV through a Parquet copy next to it, rebuilt whenever the CSV changes."""
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        try:
+            return pd.read_parquet(parquet_path)
+        except (OSError, ValueError): # Unreadable copy (Arrow errors are ValueError/OSError subclasses)
+            pass # Rebuild it below so the next cold start reads Parquet again
+
+    df = pd.read_csv(csv_path, dtype={'ProductID': 'string'})
+    write_parquet_atomically(df, parquet_path)
+    return df
+
 @st.cache_data
 def load_data():
-    """Loads product and YouTube data from CSVs."""
+    """Loads product and YouTube data from CSVs (via their Parquet copies)."""
     try:
-        products_df = pd.read_csv("RMTS Agent Data - Products.csv")
-        youtube_df = pd.read_csv("RMTS Agent Data - YouTube Links.csv")
+        products_df = read_csv_via_parquet("RMTS Agent Data - Products.csv")
+        youtube_df = read_csv_via_parquet("RMTS Agent Data - YouTube Links.csv")
+        # Precompute the lowercase text columns once so matching never lowercases per query
+        products_df['ProductName_lc'] = products_df['ProductName'].fillna('').str.lower()
+        products_df['RelatedKeywords_lc'] = products_df['RelatedKeywords'].fillna('').str.lower()
+        # Arrow-backed strings let pandas run substring/regex scans in C
+        products_df['search_text'] = (
+            products_df['ProductName_lc'] + ' ' + products_df['RelatedKeywords_lc']
+        ).astype('string[pyarrow]')
+        # ProductIDs are a small fixed set, so store them as categorical codes. They are
+        # uppercased like the YouTube IDs in build_video_index so video lookups ignore case.
+        products_df['ProductID'] = products_df['ProductID'].str.upper().astype('category')
+        youtube_df['ProductID'] = youtube_df['ProductID'].fillna('')
         return products_df, youtube_df
     except FileNotFoundError:
         st.error("Error: Make sure 'RMTS Agent Data - Products.csv' and 'RMTS Agent Data - YouTube Links.csv' are in the same directory.")
         return pd.DataFrame(), pd.DataFrame() # Return empty DFs on error
 
-products_df, youtube_df = load_data()
+def build_keyword_automaton(products_df):
+    """Builds an Aho-Corasick automaton mapping product keywords to ProductIDs."""
+    keyword_to_ids = {}
+    if not products_df.empty:
+        for product_id, name, related in zip(
+            products_df['ProductID'], products_df['ProductName_lc'], products_df['RelatedKeywords_lc']
+        ):
+            phrases = [keyword.strip() for keyword in related.split(',')]
+            # Single words of the name and of multi-word keywords ('run faster') are keywords too
+            words = [token for token in TOKEN_RE.findall(' '.join([name] + phrases)) if token not in STOPWORDS]
+            for keyword in words + phrases:
+                if keyword:
+                    keyword_to_ids.setdefault(keyword, set()).add(product_id)
+
+    automaton = ahocorasick.Automaton()
+    for keyword, product_ids in keyword_to_ids.items():
+        automaton.add_word(keyword, (len(keyword), product_ids))
+    if keyword_to_ids:
+        automaton.make_automaton()
+    return automaton
+
+def build_video_index(youtube_df):
+    """Maps each ProductID to its first 3 (title, url) videos, splitting cells that list several IDs."""
+    pid_to_videos = {}
+    if youtube_df.empty:
+        return pid_to_videos
+
+    # IDs are matched exactly (so 'P1' can never pick up 'P12'); both sides are
+    # uppercased so the lookup stays case-insensitive like the old substring scan
+    product_id_lists = youtube_df['ProductID'].str.upper().str.split(r'[,;\s]+')
+    exploded = youtube_df.assign(ProductID=product_id_lists).explode('ProductID')
+    exploded = exploded[exploded['ProductID'] != '']
+    top_videos = exploded.groupby('ProductID', sort=False).head(3)
+    for product_id, video_title, video_url in zip(top_videos['ProductID'], top_videos['VideoTitle'], top_videos['VideoURL']):
+        pid_to_videos.setdefault(product_id, []).append((video_title, video_url))
+    return pid_to_videos
+
+@st.cache_resource
+def build_indices():
+    """
+    Builds the read-only lookup structures once. Stored with cache_resource so every
+    rerun shares the same objects instead of hashing and copying them.
+    """
+    products_df, youtube_df = load_data()
+    return {
+        'products_df': products_df,
+        'youtube_df': youtube_df,
+        'search_texts': [] if products_df.empty else products_df['search_text'].tolist(),
+        'search_series': products_df.get('search_text'),
+        'pid_to_videos': build_video_index(youtube_df),
+        'automaton': build_keyword_automaton(products_df),
+    }
+
+# Pin the shared indices in the session so later reruns skip even the cache lookup.
+# This copy is per-session and is NOT refreshed by the resource cache: whoever clears
+# it (st.cache_resource.clear(), a data reload) must also drop st.session_state.idx,
+# or this session keeps showing the old frames while get_simple_chatbot_response,
+# which calls build_indices() itself, answers from the new ones.
+if 'idx' not in st.session_state:
+    st.session_state.idx = build_indices()
+indices = st.session_state.idx
+products_df, youtube_df = indices['products_df'], indices['youtube_df']
 
 # --- Chatbot Logic (UPDATED) ---
-def get_simple_chatbot_response(user_query, products_df, youtube_df):
+MAX_PRODUCTS = 5 # Cap on products listed in a single reply
+VECTORIZE_THRESHOLD = 2000 # Catalog size above which the fallback scan goes through pandas
+NO_MATCH_RESPONSE = "I'm sorry, I couldn't find any products that match your query. Could you try asking in a different way? For example, ask about 'improving my golf swing' or 'core strength'."
+
+@st.cache_data(show_spinner=False)
+def get_simple_chatbot_response(user_query: str) -> str:
     """
     Finds relevant products and lists multiple associated videos based on keywords.
+    Cached per query string; the data is pulled from the cached indices rather than
+    passed in, so Streamlit never has to hash the DataFrames.
     """
+    indices = build_indices()
+    products_df, youtube_df = indices['products_df'], indices['youtube_df']
+    search_texts, pid_to_videos = indices['search_texts'], indices['pid_to_videos']
+    keyword_automaton = indices['automaton']
     if products_df.empty or youtube_df.empty:
         return "Sorry, the product data could not be loaded. Please check the data files."
 
-    user_keywords = [word.lower() for word in re.findall(r'\b\w+\b', user_query) if len(word) > 2]
-    
-    # Filter products based on our new enhanced keywords
-    relevant_products = []
-    for _, product in products_df.iterrows():
-        product_text = f"{product['ProductName'].lower()} {str(product.get('RelatedKeywords', '')).lower()}".strip()
-        
-        if any(keyword in product_text for keyword in user_keywords):
-            relevant_products.append(product)
+    # Run the query through the product keyword automaton in a single linear scan,
+    # keeping only whole-word keyword hits (a trailing plural 's' is allowed)
+    query = user_query.lower()
+    matched_words = {}
+    for end, (length, product_ids) in keyword_automaton.iter(query):
+        start = end - length + 1
+        after = end + 2 if query[end + 1:end + 2] == 's' else end + 1
+        if (start == 0 or not query[start - 1].isalnum()) and (after >= len(query) or not query[after].isalnum()):
+            words = query[start:end + 1].split()
+            for product_id in product_ids:
+                matched_words.setdefault(product_id, set()).update(words)
+
+    # Score each product by how many distinct query words its keywords cover, so a word
+    # matched by several overlapping keywords ('bosu', 'bosu elite') only counts once.
+    # Ties keep catalog order.
+    keyword_hits = {product_id: len(words) for product_id, words in matched_words.items()}
+
+    # Mapping a categorical can return another categorical (when the mapping is
+    # one-to-one), so cast to numbers.
+    scores = products_df['ProductID'].map(keyword_hits).astype('float64').fillna(0)
+
+    # No whole-keyword hits: fall back to partial matches of the user's words inside the
+    # product text. Only this path scans every product.
+    if not keyword_hits:
+        user_keywords = tuple(dict.fromkeys( # Drop repeated words
+            keyword for keyword in TOKEN_RE.findall(query) if keyword not in STOPWORDS
+        ))
+        if user_keywords:
+            # One compiled alternation counts every keyword in a single pass per text.
+            # Small catalogs are faster in plain Python than through pandas' call overhead.
+            keyword_pattern = re.compile('|'.join(map(re.escape, user_keywords)))
+            if len(search_texts) < VECTORIZE_THRESHOLD:
+                partial_scores = pd.Series(
+                    [len(keyword_pattern.findall(text)) for text in search_texts],
+                    index=products_df.index,
+                )
+            else:
+                partial_scores = indices['search_series'].str.count(keyword_pattern)
+            scores = scores + partial_scores
 
-    if not relevant_products:
-        return "I'm sorry, I couldn't find any products that match your query. Could you try asking in a different way? For example, ask about 'improving my golf swing' or 'core strength'."
+    # Only the best few products make it into the chat reply
+    top_index = scores[scores > 0].nlargest(MAX_PRODUCTS).index
+    relevant_products = products_df.loc[top_index]
+
+    if relevant_products.empty:
+        return NO_MATCH_RESPONSE
 
     # Build a more detailed response
     responses = ["Based on your request, I found these matching products and training videos for you:"]
 
-    for product in relevant_products:
-        product_name = product['ProductName']
-        product_url = product['ProductURL']
-        product_id = product['ProductID']
+    # Zip aligned column arrays instead of building a row object per product
+    names = relevant_products['ProductName'].to_numpy()
+    urls = relevant_products['ProductURL'].to_numpy()
+    product_ids = relevant_products['ProductID'].to_numpy()
+
+    for product_name, product_url, product_id in zip(names, urls, product_ids):
+        # Look up the related YouTube videos for this product
+        related_videos = pid_to_videos.get(product_id, [])
 
-        # Find all related YouTube videos for this product
-        related_videos = youtube_df[
-            youtube_df['ProductID'].astype(str).str.contains(str(product_id), case=False, na=False)
+        # Collect the lines for this specific product and join them once
+        parts = [
+            f"### {product_name}",
+            "This product is a great choice for what you're looking for. You can learn more and purchase it here:",
+            f"➡️ **[{product_name} Product Page]({product_url})**",
+            "",
         ]
-        
-        # Start building the response for this specific product
-        product_response = f"### {product_name}\n"
-        product_response += f"This product is a great choice for what you're looking for. You can learn more and purchase it here:\n"
-        product_response += f"➡️ **[{product_name} Product Page]({product_url})**\n"
 
         # NEW: Add up to 3 videos instead of just one
-        if not related_videos.empty:
-            product_response += "\nHere are some popular training videos to get you started:\n"
-            video_links = []
-            # Loop through the first 3 videos found
-            for _, video in related_videos.head(3).iterrows():
-                video_title = video['VideoTitle']
-                video_url = video['VideoURL']
-                video_links.append(f"- [{video_title}]({video_url})")
-            
-            product_response += "\n".join(video_links)
+        if related_videos:
+            parts.append("Here are some popular training videos to get you started:")
+            parts.extend(f"- [{video_title}]({video_url})" for video_title, video_url in related_videos)
         else:
-            product_response += "\n_I couldn't find a specific training video for this product, but check out the WeckMethod YouTube channel for hundreds of tutorials!_"
-        
+            parts.append("_I couldn't find a specific training video for this product, but check out the WeckMethod YouTube channel for hundreds of tutorials!_")
+
+        product_response = "\n".join(parts)
         responses.append(product_response)
             
     return "\n\n---\n\n".join(responses) # Use a separator for multiple products
@@ -79,9 +235,16 @@ st.title("🏋️ WeckMethod Product & Training Assistant")
 st.markdown("### Ask me about WeckMethod products!")
 st.info("Example questions: 'What can I use for footwork?', 'Tell me about the BOSU Elite', 'Do you have anything for strength training?'")
 
+PREVIEW_ROWS = 50 # Rows shown per table in the raw data preview
+
 col1, col2 = st.columns([2, 1])
 
-with col1:
+@st.fragment
+def chat_pane():
+    """
+    Chat history and input. Running as a fragment means a new chat message only
+    reruns this pane, not the rest of the page.
+    """
     if "messages" not in st.session_state:
         st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I help you find the right WeckMethod product today?"}]
 
@@ -95,13 +258,17 @@ with col1:
 
         with st.chat_message("assistant"):
             with st.spinner("Finding the best recommendations..."):
-                response = get_simple_chatbot_response(prompt, products_df, youtube_df)
+                response = get_simple_chatbot_response(prompt)
             st.markdown(response)
         st.session_state.messages.append({"role": "assistant", "content": response})
 
+with col1:
+    chat_pane()
+
 with col2:
-    st.header("Raw Data Preview")
-    st.subheader("WeckMethod Products")
-    st.dataframe(products_df, height=300)
-    st.subheader("WeckMethod YouTube Links")
-    st.dataframe(youtube_df, height=300)
+    # Collapsed by default and capped, so the frames are only sent to the browser on demand
+    with st.expander("Raw Data Preview", expanded=False):
+        st.subheader("WeckMethod Products")
+        st.dataframe(products_df.drop(columns=DERIVED_PRODUCT_COLUMNS, errors='ignore').head(PREVIEW_ROWS), height=300)
+        st.subheader("WeckMethod YouTube Links")
+        st.dataframe(youtube_df.head(PREVIEW_ROWS), height=300)